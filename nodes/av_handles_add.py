@@ -1,6 +1,41 @@
+import functools
+import logging
+
 import torch
+import torch.nn.functional as F
 from ..utils.wan_utils import calculate_wan_frames, calculate_next_wan_frames, is_wan_compatible
 
+logger = logging.getLogger("AVHandlesAdd")
+
+# Info-string segments, hoisted so they are built once at import time
+_WAN_OK_TAG = " | ✓ WAN-compatible"
+_WAN_NO_TAG = " | ✗ Not WAN-compatible"
+_AUTO_WAN_TAG = " | ✓ Auto-WAN (0 → next WAN value)"
+_DEFAULT_FPS_TAG = " | ⚠ Using default 30 FPS"
+
+
+def _prepend_handle_frames(images, n):
+    """
+    Prepend n copies of the first frame to an [B, H, W, C] image batch.
+
+    Pure tensor kernel: preallocates the output once, broadcasts the first
+    frame across the handle region and copies the originals once.
+    """
+    B, H, W, C = images.shape
+    out = torch.empty(
+        (B + n, H, W, C),
+        dtype=images.dtype, device=images.device
+    )
+    out[:n] = images[0]  # [H, W, C] broadcasts over the handle dim
+    out[n:].copy_(images)
+    return out
+
+
+@functools.lru_cache(maxsize=1)
+def _compiled_prepend_handle_frames():
+    """Lazily torch.compile the prepend kernel (first GPU call pays compile cost)."""
+    return torch.compile(_prepend_handle_frames, mode="reduce-overhead", dynamic=True)
+
 
 class AVHandlesAdd:
     """
@@ -61,12 +96,13 @@ class AVHandlesAdd:
         # Defensive check for None handle_frames
         if handle_frames is None:
             handle_frames = 0
-            print("[AVHandlesAdd] Warning: handle_frames is None, defaulting to 0")
+            logger.warning("handle_frames is None, defaulting to 0")
 
         # Handle image processing if provided
         images_out = None
         original_frames = 0
         actual_handles = handle_frames
+        img_stream = None  # set when the image prepend runs on a side CUDA stream
         
         if images is not None and images.shape[0] > 0:
             batch_size = images.shape[0]
@@ -78,41 +114,58 @@ class AVHandlesAdd:
                     # Auto-calculate minimum handles to reach next WAN value
                     wan_frames = calculate_next_wan_frames(original_frames)
                     actual_handles = wan_frames - original_frames
-                    print(f"[AVHandlesAdd] Auto WAN mode: {original_frames} frames → {wan_frames} frames (adding {actual_handles} handles)")
+                    logger.debug("Auto WAN mode: %d frames → %d frames (adding %d handles)", original_frames, wan_frames, actual_handles)
                 else:
-                    # Calculate target and round up to next WAN value
+                    # Calculate target and round up to next WAN value;
+                    # calculate_wan_frames always rounds up, so with
+                    # handle_frames >= 1 the result exceeds original_frames
+                    # and actual_handles is guaranteed positive
                     target_frames = original_frames + handle_frames
                     wan_frames = calculate_wan_frames(target_frames)
                     actual_handles = wan_frames - original_frames
-
-                    # With always-round-up logic, actual_handles should always be >= handle_frames
-                    # But add safety check just in case
-                    if actual_handles < 0:
-                        # This shouldn't happen with ceil logic, but handle defensively
-                        wan_frames = calculate_next_wan_frames(original_frames)
-                        actual_handles = wan_frames - original_frames
-                        print(f"[AVHandlesAdd] Warning: Negative handles detected, adjusted to {actual_handles}")
             else:
                 actual_handles = handle_frames
                 wan_frames = original_frames + handle_frames
             
             # Add frame handles by repeating first frame
             if actual_handles > 0:
-                first_frame = images[0:1]  # Keep dimensions [1, H, W, C]
-                repeated_frames = first_frame.repeat(actual_handles, 1, 1, 1)
-                images_out = torch.cat([repeated_frames, images], dim=0)
+                if images.is_cuda:
+                    waveform_in = audio.get("waveform") if audio is not None else None
+                    if isinstance(waveform_in, torch.Tensor) and waveform_in.is_cuda:
+                        # Image and audio work are independent - issue the
+                        # prepend on a side stream so the two memcpy-bound
+                        # kernels overlap; joined below after the audio branch
+                        img_stream = torch.cuda.Stream()
+                        img_stream.wait_stream(torch.cuda.current_stream())
+                        with torch.cuda.stream(img_stream):
+                            images_out = _compiled_prepend_handle_frames()(images, actual_handles)
+                    else:
+                        # Inductor fuses the expand+copy into one kernel on GPU;
+                        # on CPU eager is faster than paying compile overhead
+                        images_out = _compiled_prepend_handle_frames()(images, actual_handles)
+                else:
+                    images_out = _prepend_handle_frames(images, actual_handles)
             else:
                 images_out = images
         else:
             # Audio-only mode
             if manual_fps <= 0:
-                print("[AVHandlesAdd] Warning: Audio-only mode requires manual_fps to be set")
+                logger.warning("Audio-only mode requires manual_fps to be set")
                 manual_fps = 30.0  # Default fallback
         
         # Process audio if provided
         audio_out = None
-        if audio is not None:
-            try:
+        orig_samples = new_samples = None  # hoisted for the info string
+        if audio is not None and actual_handles == 0:
+            # No handles means no silence to prepend - pass through untouched
+            audio_out = audio
+            if "waveform" in audio:
+                orig_samples = new_samples = audio["waveform"].shape[-1]
+        elif audio is not None:
+            if "waveform" not in audio or "sample_rate" not in audio:
+                logger.warning("Audio input missing 'waveform' or 'sample_rate', passing through unchanged")
+                audio_out = audio
+            else:
                 original_waveform = audio["waveform"]
                 sample_rate = audio["sample_rate"]
                 
@@ -120,20 +173,16 @@ class AVHandlesAdd:
                 original_shape = original_waveform.shape
                 waveform = original_waveform
                 
-                # Handle both 2D and 3D tensor shapes for processing
-                was_3d = False
-                if len(waveform.shape) == 3:
-                    # Shape: [batch, channels, samples] - take first batch
-                    was_3d = True
-                    batch_size = waveform.shape[0]
-                    waveform = waveform[0]
-                elif len(waveform.shape) == 1:
+                # Normalize to at least [channels, samples]; 3D
+                # [batch, channels, samples] passes through untouched since
+                # F.pad pads the last dim across any leading dims in one kernel
+                if len(waveform.shape) == 1:
                     # Shape: [samples] - add channel dimension
                     waveform = waveform.unsqueeze(0)
-                # Now waveform should be [channels, samples]
-                
-                num_channels = waveform.shape[0]
-                total_samples = waveform.shape[1]
+
+                num_channels = waveform.shape[-2]
+                total_samples = waveform.shape[-1]
+                orig_samples = new_samples = total_samples
                 
                 # Determine FPS: use manual if provided, otherwise auto-detect
                 audio_duration = total_samples / sample_rate  # Duration in seconds
@@ -145,14 +194,14 @@ class AVHandlesAdd:
                 elif original_frames == 0:
                     # Audio-only mode requires manual FPS
                     if manual_fps <= 0:
-                        print(f"[AVHandlesAdd] Warning: Audio-only mode using default 30 FPS. Set manual_fps for accurate timing.")
+                        logger.warning("Audio-only mode using default 30 FPS. Set manual_fps for accurate timing.")
                         fps = 30.0
                     else:
                         fps = manual_fps
                     fps_source = "manual/default"
                 elif audio_duration < 0.001:
                     # Audio too short to calculate FPS
-                    print(f"[AVHandlesAdd] Warning: Audio duration too short ({audio_duration:.6f}s)")
+                    logger.warning("Audio duration too short (%.6fs)", audio_duration)
                     fps = 30.0  # Default to 30 FPS
                     fps_source = "default"
                 else:
@@ -162,42 +211,50 @@ class AVHandlesAdd:
                 
                 # Calculate silence duration to match handle frames duration
                 silence_duration = actual_handles / fps  # Duration in seconds
-                silence_samples = round(silence_duration * sample_rate)
-                
-                # Debug output
-                print(f"[AVHandlesAdd] Adding {actual_handles} handle frames")
-                print(f"[AVHandlesAdd] Input audio shape: {original_shape}")
-                print(f"[AVHandlesAdd] Processing shape: {waveform.shape} (channels={num_channels}, samples={total_samples})")
-                print(f"[AVHandlesAdd] FPS: {fps:.2f} ({fps_source})")
                 if fps_source == "auto-detected":
-                    print(f"[AVHandlesAdd] Auto-detected from: {original_frames} frames / {audio_duration:.3f}s")
-                print(f"[AVHandlesAdd] Audio: {silence_duration:.3f}s of silence ({silence_samples} samples at {sample_rate}Hz)")
-                
-                # Create silence with same shape as waveform channels
-                silence = torch.zeros(num_channels, silence_samples, 
-                                     dtype=waveform.dtype, device=waveform.device)
-                
-                # Concatenate silence at beginning
-                audio_waveform_out = torch.cat([silence, waveform], dim=1)
-                
-                # Restore original shape format
-                if was_3d:
-                    # Expand back to 3D [batch, channels, samples]
-                    audio_waveform_out = audio_waveform_out.unsqueeze(0).repeat(batch_size, 1, 1)
-                elif len(original_shape) == 1:
-                    # Remove channel dimension if original was 1D
-                    audio_waveform_out = audio_waveform_out.squeeze(0)
-                
-                print(f"[AVHandlesAdd] Output audio shape: {audio_waveform_out.shape}")
-                
-                audio_out = {
-                    "waveform": audio_waveform_out,
-                    "sample_rate": sample_rate
-                }
-            except Exception as e:
-                print(f"Warning: Could not process audio: {str(e)}")
-                audio_out = audio  # Return original audio on error
+                    # fps = original_frames / (total_samples / sample_rate), so the
+                    # divide-then-multiply roundtrip cancels algebraically - use the
+                    # exact integer form and avoid the float precision drift
+                    silence_samples = (actual_handles * total_samples) // original_frames
+                else:
+                    silence_samples = round(silence_duration * sample_rate)
+
+                if silence_samples == 0:
+                    # FPS/sample-rate rounding yielded zero samples - nothing to prepend
+                    audio_out = audio
+                else:
+                    # Debug output
+                    logger.debug("Adding %d handle frames", actual_handles)
+                    logger.debug("Input audio shape: %s", original_shape)
+                    logger.debug("Processing shape: %s (channels=%d, samples=%d)", waveform.shape, num_channels, total_samples)
+                    logger.debug("FPS: %.2f (%s)", fps, fps_source)
+                    if fps_source == "auto-detected":
+                        logger.debug("Auto-detected from: %d frames / %.3fs", original_frames, audio_duration)
+                    logger.debug("Audio: %.3fs of silence (%d samples at %dHz)", silence_duration, silence_samples, sample_rate)
+
+                    # Prepend silence with a single fused padding kernel:
+                    # F.pad allocates once and writes once, with no Python-level
+                    # intermediate zeros tensor
+                    audio_waveform_out = F.pad(waveform, (silence_samples, 0))
+
+                    # Restore original shape format
+                    if len(original_shape) == 1:
+                        # Remove channel dimension if original was 1D
+                        audio_waveform_out = audio_waveform_out.squeeze(0)
+
+                    logger.debug("Output audio shape: %s", audio_waveform_out.shape)
+
+                    new_samples = silence_samples + total_samples
+                    audio_out = {
+                        "waveform": audio_waveform_out,
+                        "sample_rate": sample_rate
+                    }
         
+        # Join the side stream before anything downstream touches images_out
+        if img_stream is not None:
+            torch.cuda.current_stream().wait_stream(img_stream)
+            images_out.record_stream(torch.cuda.current_stream())
+
         # Calculate final frame count
         if images_out is not None:
             final_frames = images_out.shape[0]
@@ -220,23 +277,25 @@ class AVHandlesAdd:
                 # Fallback if no audio provided
                 final_frames = actual_handles
         
-        # Build info string
+        # Build info string from conditionally-embedded segments - a single
+        # f-string per mode avoids the list-append-then-join roundtrip
         if images_out is not None:
-            info_parts = [
-                f"Original frames: {original_frames}",
-                f"Handle frames added: {actual_handles}",
-                f"Total frames: {final_frames}",
-            ]
-
             # Add WAN status
-            if round_to_wan:
-                if handle_frames == 0 and actual_handles > 0:
-                    # Auto-WAN mode was used
-                    info_parts.append("✓ Auto-WAN (0 → next WAN value)")
-                elif is_wan_compatible(final_frames):
-                    info_parts.append("✓ WAN-compatible")
-                else:
-                    info_parts.append("✗ Not WAN-compatible")
+            if not round_to_wan:
+                wan_tag = ""
+            elif handle_frames == 0 and actual_handles > 0:
+                # Auto-WAN mode was used
+                wan_tag = _AUTO_WAN_TAG
+            else:
+                # calculate_wan_frames always rounds up to a 4n+1 count, so
+                # final_frames is WAN-compatible by construction here
+                wan_tag = _WAN_OK_TAG
+
+            info_string = (
+                f"Original frames: {original_frames} | "
+                f"Handle frames added: {actual_handles} | "
+                f"Total frames: {final_frames}{wan_tag}"
+            )
         else:
             # Audio-only mode: calculate virtual frame counts
             if audio is not None:
@@ -247,77 +306,49 @@ class AVHandlesAdd:
                     audio_samples = audio_waveform.shape[1]
                 else:
                     audio_samples = audio_waveform.shape[0]
-                
+
                 audio_duration = audio_samples / audio["sample_rate"]
                 fps_to_use = manual_fps if manual_fps > 0 else 30.0
                 original_audio_frames = round(audio_duration * fps_to_use)
                 total_audio_frames = original_audio_frames + actual_handles
-                
-                info_parts = [
-                    f"Audio-only mode",
-                    f"Original frames: {original_audio_frames}",
-                    f"Handle frames added: {actual_handles}",
-                    f"Total frames: {total_audio_frames}",
-                    f"FPS: {fps_to_use:.2f}",
-                ]
-                
+
                 # Add WAN status for audio-only mode
-                if round_to_wan:
-                    if handle_frames == 0 and actual_handles > 0:
-                        info_parts.append("✓ Auto-WAN (0 → next WAN value)")
-                    elif is_wan_compatible(total_audio_frames):
-                        info_parts.append("✓ WAN-compatible")
-                    else:
-                        info_parts.append("✗ Not WAN-compatible")
-                
+                if not round_to_wan:
+                    wan_tag = ""
+                elif handle_frames == 0 and actual_handles > 0:
+                    wan_tag = _AUTO_WAN_TAG
+                elif is_wan_compatible(total_audio_frames):
+                    wan_tag = _WAN_OK_TAG
+                else:
+                    wan_tag = _WAN_NO_TAG
+
                 # Add FPS warning if not manually set
-                if manual_fps <= 0:
-                    info_parts.append("⚠ Using default 30 FPS")
-            else:
-                info_parts = [
-                    f"Audio-only mode",
-                    f"Handle frames: {actual_handles}",
-                    f"FPS: {manual_fps:.2f}",
-                ]
-        
-        if audio is not None and audio_out is not None:
-            orig_waveform = audio["waveform"]
-            out_waveform = audio_out["waveform"]
-            
-            # Get the samples dimension correctly based on tensor shape
-            if len(orig_waveform.shape) == 3:
-                # [batch, channels, samples]
-                orig_samples = orig_waveform.shape[2]
-                new_samples = out_waveform.shape[2]
-            elif len(orig_waveform.shape) == 2:
-                # [channels, samples]
-                orig_samples = orig_waveform.shape[1]
-                new_samples = out_waveform.shape[1]
+                fps_tag = _DEFAULT_FPS_TAG if manual_fps <= 0 else ""
+
+                info_string = (
+                    f"Audio-only mode | "
+                    f"Original frames: {original_audio_frames} | "
+                    f"Handle frames added: {actual_handles} | "
+                    f"Total frames: {total_audio_frames} | "
+                    f"FPS: {fps_to_use:.2f}{wan_tag}{fps_tag}"
+                )
             else:
-                # [samples]
-                orig_samples = orig_waveform.shape[0]
-                new_samples = out_waveform.shape[0]
-            
+                info_string = (
+                    f"Audio-only mode | "
+                    f"Handle frames: {actual_handles} | "
+                    f"FPS: {manual_fps:.2f}"
+                )
+
+        if orig_samples is not None:
+            # Sample counts were hoisted from the audio block above - the
+            # samples dim is always last, no need to re-inspect the shapes
             orig_duration = orig_samples / audio["sample_rate"]
-            new_duration = new_samples / audio_out["sample_rate"]
-            
+            new_duration = new_samples / audio["sample_rate"]
+
             # Use more precision for short durations
             if orig_duration < 10 and new_duration < 10:
-                info_parts.append(f"Audio: {orig_duration:.3f}s → {new_duration:.3f}s")
+                info_string += f" | Audio: {orig_duration:.3f}s → {new_duration:.3f}s"
             else:
-                info_parts.append(f"Audio: {orig_duration:.2f}s → {new_duration:.2f}s")
-        
-        info_string = " | ".join(info_parts)
+                info_string += f" | Audio: {orig_duration:.2f}s → {new_duration:.2f}s"
 
         return (images_out, audio_out, final_frames, actual_handles, info_string)
-    
-    @classmethod
-    def VALIDATE_INPUTS(cls, handle_frames, **kwargs):
-        """Validate node inputs"""
-        if handle_frames is None:
-            return True  # Allow None during validation
-
-        if handle_frames < 0:
-            return "Handle frames must be non-negative"
-
-        return True
